@@ -271,12 +271,14 @@
 
 
 
+import os
 import streamlit as st
 import pandas as pd
-import time
 import google.generativeai as genai
 import concurrent.futures
 from io import StringIO
+from quota import QuotaCoordinator, KeyClients
+from manifest import row_inputs, load_latest_manifest, plan_run, save_manifest
 
 
 st.set_page_config(page_title="Bulk Meta Generator", layout="wide")
@@ -289,12 +291,35 @@ API_KEYS = [
     st.secrets["GEMINI_API_KEY_4"]
 ]
 
+# One ledger shared by every session and process on this host (per-key limits per 60s window)
+@st.cache_resource
+def get_quota():
+    return QuotaCoordinator(API_KEYS, requests_per_window=10, tokens_per_window=250000)
+
+quota = get_quota()
+
+def make_gemini_client(api_key):
+    # configure() swaps the process-wide client, so grab a fresh one bound to this key right away
+    genai.configure(api_key=api_key)
+    return genai.client.get_default_generative_client()
+
+# Shared by every session in this process, so a request always goes out on the key it leased
+@st.cache_resource
+def get_gemini_clients():
+    return KeyClients(make_gemini_client)
+
+gemini_clients = get_gemini_clients()
+
 # Load keyword dataset
+KEYWORD_FILE = "keyword_data.csv"  # Place your 4000-row keyword CSV in app folder
+
+# The file's mtime is part of the cache key, so editing the CSV invalidates the cache
+# (and with it keywords_hash in the run manifest) without restarting the server
 @st.cache_data
-def load_keyword_data():
-    return pd.read_csv("keyword_data.csv")  # Place your 4000-row keyword CSV in app folder
+def load_keyword_data(mtime_ns):
+    return pd.read_csv(KEYWORD_FILE)
 
-keyword_df = load_keyword_data()
+keyword_df = load_keyword_data(os.stat(KEYWORD_FILE).st_mtime_ns)
 
 # Preprocess and rank keywords
 def get_best_keywords(df, top_n=10):
@@ -331,15 +356,25 @@ Input:
 - High-value Keywords: {keywords}
 """
 
-def generate_with_model(api_key, product_name):
+MODEL_NAME = "gemini-2.5-flash"
+
+def get_row_inputs(product_name):
+    return row_inputs(product_name, BEST_KEYWORDS, PROMPT_TEMPLATE, MODEL_NAME)
+
+def generate_with_model(job_id, product_name):
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-2.5-flash")
         prompt = PROMPT_TEMPLATE.format(
             product_name=product_name,
             keywords=", ".join(BEST_KEYWORDS)
         )
+        # Rough estimate (~4 chars per token plus the reply) until the real count comes back
+        api_key, lease_id = quota.acquire(job_id, est_tokens=len(prompt) // 4 + 200)
+        model = genai.GenerativeModel(MODEL_NAME)
+        model._client = gemini_clients.get(api_key)
         response = model.generate_content(prompt)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            quota.record(lease_id, usage.total_token_count)
         return parse_response(product_name, response.text)
     except Exception as e:
         return {"Product Name": product_name, "Meta Title": f"Error: {e}", "Meta Description": ""}
@@ -362,24 +397,26 @@ def run_bulk_processing(product_names):
 
     progress = st.empty()
     status = st.empty()
+    job_id = quota.new_job()
 
-    with st.spinner("🚀 Bulk processing started..."):
-        for i in range(0, total, batch_size):
-            batch = product_names[i:i+batch_size]
-            futures = []
+    try:
+        with st.spinner("🚀 Bulk processing started..."):
+            for i in range(0, total, batch_size):
+                batch = product_names[i:i+batch_size]
+                futures = []
             
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                for j, product in enumerate(batch):
-                    key = API_KEYS[j % len(API_KEYS)]
-                    futures.append(executor.submit(generate_with_model, key, product))
+                with concurrent.futures.ThreadPoolExecutor() as executor:
+                    for product in batch:
+                        futures.append(executor.submit(generate_with_model, job_id, product))
 
-                for idx, future in enumerate(futures):
-                    result = future.result()
-                    results.append(result)
-                    status.markdown(f"✅ Processed Row {i + idx + 1}: `{result['Product Name']}`")
+                    for idx, future in enumerate(futures):
+                        result = future.result()
+                        results.append(result)
+                        status.markdown(f"✅ Processed Row {i + idx + 1}: `{result['Product Name']}`")
 
-            progress.progress(min((i + batch_size) / total, 1.0))
-            time.sleep(2)
+                progress.progress(min((i + batch_size) / total, 1.0))
+    finally:
+        quota.release_job(job_id)
 
     return results
 
@@ -394,8 +431,19 @@ def main():
             return
 
         st.success(f"✅ {len(df)} products loaded.")
+
+        # Diff against earlier runs so only rows whose inputs changed hit the API
+        product_names = df["Product Name"].tolist()
+        reused, stale = plan_run(product_names, load_latest_manifest(), get_row_inputs)
+        st.info(f"♻️ {len(reused)} products reused from earlier runs, {len(stale)} products to regenerate.")
+
         if st.button("🚀 Start Bulk Generation"):
-            results = run_bulk_processing(df["Product Name"].tolist())
+            generated = {}
+            if stale:
+                for result in run_bulk_processing(stale):
+                    generated[result["Product Name"]] = result
+            results = [reused.get(name) or generated[name] for name in product_names]
+            save_manifest(results, get_row_inputs)
             result_df = pd.DataFrame(results)
             st.dataframe(result_df)
 
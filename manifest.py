@@ -0,0 +1,169 @@
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+
+# One JSON manifest per bulk run, plus a merged index holding the newest row per product
+DEFAULT_MANIFEST_DIR = "run_manifests"
+INDEX_FILE = "index.json"
+KEEP_RUNS = 10
+
+
+def _hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def row_inputs(product_name, keywords, prompt_template, model_name):
+    """Hashes of everything that feeds the output for one row."""
+    return {
+        "product_hash": _hash(str(product_name)),
+        "keywords_hash": _hash(json.dumps(list(keywords))),
+        "template_hash": _hash(prompt_template),
+        "model": model_name,
+    }
+
+
+def _is_usable(row):
+    # Failed or unparsed rows are never carried forward, they always get another attempt
+    title = row.get("Meta Title") or ""
+    return bool(title and row.get("Meta Description") and not title.startswith("Error:"))
+
+
+def _read_rows(path):
+    """Rows from one manifest file keyed by product hash, or None if the file is unreadable."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        rows = data["rows"]
+        if isinstance(rows, dict):
+            rows = rows.values()
+        return {
+            row["product_hash"]: row
+            for row in rows
+            if isinstance(row, dict) and isinstance(row.get("product_hash"), str)
+        }
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def _run_paths(manifest_dir):
+    # Names are fixed-width run ids handed out under the lock, so this is oldest first
+    return sorted(glob.glob(os.path.join(manifest_dir, "run_*.json")))
+
+
+def _run_id(path):
+    try:
+        return int(os.path.basename(path)[len("run_"):-len(".json")])
+    except ValueError:
+        return 0
+
+
+def load_latest_manifest(manifest_dir=DEFAULT_MANIFEST_DIR):
+    """
+    Newest known row for every product, keyed by product hash, whichever run produced it.
+    Falls back to merging the run files newest first if the index is missing or corrupt.
+    """
+    rows = _read_rows(os.path.join(manifest_dir, INDEX_FILE))
+    if rows is not None:
+        return rows
+    rows = {}
+    for path in reversed(_run_paths(manifest_dir)):
+        for product_hash, row in (_read_rows(path) or {}).items():
+            rows.setdefault(product_hash, row)
+    return rows
+
+
+def plan_run(product_names, previous, inputs_for):
+    """
+    Split product_names into rows that can be carried forward and rows to regenerate.
+    Returns (reused, stale): reused maps product name -> previous output, stale is a list of names.
+    """
+    reused = {}
+    stale = []
+    seen = set()
+    for name in product_names:
+        if name in seen:
+            continue
+        seen.add(name)
+        inputs = inputs_for(name)
+        row = previous.get(inputs["product_hash"])
+        if (
+            row is not None
+            and all(row.get(field) == value for field, value in inputs.items())
+            and _is_usable(row)
+        ):
+            reused[name] = {
+                "Product Name": name,
+                "Meta Title": row["Meta Title"],
+                "Meta Description": row["Meta Description"],
+            }
+        else:
+            stale.append(name)
+    return reused, stale
+
+
+@contextlib.contextmanager
+def _locked(manifest_dir):
+    # Serialises index updates between sessions and processes sharing the directory
+    lock = sqlite3.connect(os.path.join(manifest_dir, "index.lock"), timeout=30, isolation_level=None)
+    try:
+        lock.execute("BEGIN EXCLUSIVE")
+        yield
+        lock.execute("COMMIT")
+    finally:
+        lock.close()
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def save_manifest(results, inputs_for, manifest_dir=DEFAULT_MANIFEST_DIR, keep_runs=KEEP_RUNS):
+    """
+    Write this run's rows (input hashes plus outputs) as a new manifest file, merge them
+    into the index and prune all but the newest keep_runs run files.
+    """
+    os.makedirs(manifest_dir, exist_ok=True)
+    rows = []
+    for result in results:
+        row = inputs_for(result["Product Name"])
+        row.update({
+            "Meta Title": result["Meta Title"],
+            "Meta Description": result["Meta Description"],
+        })
+        rows.append(row)
+    with _locked(manifest_dir):
+        # UTC nanoseconds, bumped past the newest existing run, so names always sort in save order
+        run_id = time.time_ns()
+        paths = _run_paths(manifest_dir)
+        if paths:
+            run_id = max(run_id, _run_id(paths[-1]) + 1)
+        path = os.path.join(manifest_dir, f"run_{run_id:020d}.json")
+        _write_json(path, {"created": time.time(), "rows": rows})
+
+        index = load_latest_manifest(manifest_dir)
+        for row in rows:
+            current = index.get(row["product_hash"])
+            same_inputs = current is not None and all(
+                current.get(field) == row[field]
+                for field in ("keywords_hash", "template_hash", "model")
+            )
+            # A failure here must not wipe out a good row another run made from the same inputs
+            if same_inputs and _is_usable(current) and not _is_usable(row):
+                continue
+            index[row["product_hash"]] = row
+        _write_json(os.path.join(manifest_dir, INDEX_FILE), {"updated": time.time(), "rows": index})
+
+        paths = _run_paths(manifest_dir)
+        for old_path in paths[:max(len(paths) - keep_runs, 0)]:
+            with contextlib.suppress(OSError):
+                os.remove(old_path)
+    return path
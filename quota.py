@@ -0,0 +1,195 @@
+import hashlib
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+
+# Shared ledger location - every session and process on the host uses the same file
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), "seo_meta_quota.sqlite3")
+
+
+class QuotaExhausted(Exception):
+    pass
+
+
+class QuotaCoordinator:
+    """
+    Hands out Gemini API keys to every caller on the host from one SQLite ledger.
+    Usage is tracked per key over a sliding window (requests and tokens), and
+    capacity is split evenly between the jobs that are currently active.
+    """
+
+    def __init__(self, api_keys, db_path=DEFAULT_DB_PATH, requests_per_window=10,
+                 tokens_per_window=250000, window_seconds=60, clock=time.time, sleep=time.sleep):
+        self.api_keys = list(api_keys)
+        # Only a fingerprint of each key is written to disk, never the secret itself
+        self.key_ids = [hashlib.sha256(k.encode("utf-8")).hexdigest()[:16] for k in self.api_keys]
+        self.db_path = db_path
+        self.requests_per_window = requests_per_window
+        self.tokens_per_window = tokens_per_window
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self.sleep = sleep
+        # WAL lets readers carry on while another process holds the write lock
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.close()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "id INTEGER PRIMARY KEY, key_id TEXT, job_id TEXT, ts REAL, tokens INTEGER)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS usage_ts ON usage (ts)")
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, last_seen REAL)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        return _Transaction(conn)
+
+    def new_job(self):
+        return uuid.uuid4().hex
+
+    def try_acquire(self, job_id, est_tokens=0):
+        """
+        Reserve one request for job_id on the least loaded key with room left.
+        Returns (api_key, lease_id), or None if the job has to wait.
+        """
+        with self._connect() as conn:
+            # Read the clock only once the write lock is held, or a waiting process could
+            # insert a lease stamped before rows another process has already pruned
+            now = self.clock()
+            cutoff = now - self.window_seconds
+            conn.execute("DELETE FROM usage WHERE ts < ?", (cutoff,))
+            conn.execute("DELETE FROM jobs WHERE last_seen < ?", (cutoff,))
+            # Waiting counts as activity, so a blocked job still claims its share
+            conn.execute(
+                "INSERT INTO jobs (job_id, last_seen) VALUES (?, ?) "
+                "ON CONFLICT(job_id) DO UPDATE SET last_seen = excluded.last_seen",
+                (job_id, now),
+            )
+
+            # Each active job gets an equal slice of both the request and the token budget
+            active_jobs = max(conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0], 1)
+            request_share = math.ceil(self.requests_per_window * len(self.api_keys) / active_jobs)
+            token_share = self.tokens_per_window * len(self.api_keys) / active_jobs
+            job_requests, job_tokens = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tokens), 0) FROM usage WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if job_requests >= request_share or job_tokens + est_tokens > token_share:
+                return None
+
+            usage = {
+                key_id: (requests, tokens)
+                for key_id, requests, tokens in conn.execute(
+                    "SELECT key_id, COUNT(*), COALESCE(SUM(tokens), 0) FROM usage GROUP BY key_id"
+                )
+            }
+            candidates = []
+            for index, key_id in enumerate(self.key_ids):
+                requests, tokens = usage.get(key_id, (0, 0))
+                if requests < self.requests_per_window and tokens + est_tokens <= self.tokens_per_window:
+                    candidates.append((requests, tokens, index))
+            if not candidates:
+                return None
+
+            _, _, index = min(candidates)
+            cursor = conn.execute(
+                "INSERT INTO usage (key_id, job_id, ts, tokens) VALUES (?, ?, ?, ?)",
+                (self.key_ids[index], job_id, now, est_tokens),
+            )
+            return self.api_keys[index], cursor.lastrowid
+
+    def acquire(self, job_id, est_tokens=0, timeout=300, poll_interval=1.0):
+        deadline = self.clock() + timeout
+        while True:
+            lease = self.try_acquire(job_id, est_tokens)
+            if lease is not None:
+                return lease
+            if self.clock() >= deadline:
+                raise QuotaExhausted(f"No API quota available within {timeout}s")
+            self.sleep(poll_interval)
+
+    def record(self, lease_id, tokens_used):
+        """Replace the estimated token count of a lease with the real usage."""
+        with self._connect() as conn:
+            conn.execute("UPDATE usage SET tokens = ? WHERE id = ?", (tokens_used, lease_id))
+
+    def release_job(self, job_id):
+        """Drop a finished job so its share goes back to the others straight away."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+
+class KeyClients:
+    """
+    One API client per key, built on first use and reused afterwards.
+    factory(api_key) runs under a lock, so it may touch process-wide state such as genai.configure.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, api_key):
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is None:
+                client = self.factory(api_key)
+                self._clients[api_key] = client
+            return client
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front so check-and-reserve is atomic across processes
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.conn.close()
+        return False
+
+
+class FileClock:
+    """
+    Test double: a manual clock kept in a file so several processes share one timeline.
+    Pass clock=FileClock(path) and sleep=clock.advance to a QuotaCoordinator in each process.
+    """
+
+    def __init__(self, path, start=0.0):
+        self.path = path
+        if not os.path.exists(path):
+            self._write(start)
+
+    def __call__(self):
+        with open(self.path) as f:
+            return float(f.read())
+
+    def advance(self, seconds):
+        # Serialised so two processes advancing together never lose an update
+        lock = sqlite3.connect(self.path + ".lock", timeout=30, isolation_level=None)
+        try:
+            lock.execute("BEGIN EXCLUSIVE")
+            self._write(self() + seconds)
+            lock.execute("COMMIT")
+        finally:
+            lock.close()
+
+    def _write(self, value):
+        # Write-then-rename so readers in other processes never see a half-written file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(value))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,139 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from manifest import load_latest_manifest, plan_run, row_inputs, save_manifest
+
+KEYWORDS = ["engagement rings", "diamond rings"]
+TEMPLATE = "Product: {product_name}\nKeywords: {keywords}"
+MODEL = "gemini-2.5-flash"
+
+
+def inputs_with(keywords=KEYWORDS, template=TEMPLATE, model=MODEL):
+    return lambda name: row_inputs(name, keywords, template, model)
+
+
+def result(name, title="A Title", description="A description. Shop Now!"):
+    return {"Product Name": name, "Meta Title": title, "Meta Description": description}
+
+
+def test_matching_inputs_are_carried_forward(tmp_path):
+    save_manifest([result("Ring"), result("Necklace")], inputs_with(), tmp_path)
+
+    reused, stale = plan_run(["Ring", "Necklace"], load_latest_manifest(tmp_path), inputs_with())
+
+    assert stale == []
+    assert reused["Ring"] == result("Ring")
+    assert reused["Necklace"] == result("Necklace")
+
+
+def test_changed_inputs_are_regenerated(tmp_path):
+    save_manifest([result("Ring")], inputs_with(), tmp_path)
+    previous = load_latest_manifest(tmp_path)
+
+    for changed in (
+        inputs_with(keywords=["gold rings"]),
+        inputs_with(template=TEMPLATE + "\nBe brief."),
+        inputs_with(model="gemini-2.5-pro"),
+    ):
+        assert plan_run(["Ring", "Bracelet"], previous, changed) == ({}, ["Ring", "Bracelet"])
+
+
+def test_failed_and_empty_rows_are_retried(tmp_path):
+    save_manifest(
+        [
+            result("Ring", title="Error: quota", description=""),
+            result("Necklace", title=""),
+            result("Earrings", description=""),
+            result("Pendant"),
+        ],
+        inputs_with(),
+        tmp_path,
+    )
+
+    reused, stale = plan_run(
+        ["Ring", "Necklace", "Earrings", "Pendant"], load_latest_manifest(tmp_path), inputs_with()
+    )
+
+    assert list(reused) == ["Pendant"]
+    assert stale == ["Ring", "Necklace", "Earrings"]
+
+
+def test_duplicate_product_names_are_planned_once(tmp_path):
+    save_manifest([result("Ring")], inputs_with(), tmp_path)
+
+    reused, stale = plan_run(
+        ["Ring", "Bracelet", "Ring", "Bracelet"], load_latest_manifest(tmp_path), inputs_with()
+    )
+
+    assert list(reused) == ["Ring"]
+    assert stale == ["Bracelet"]
+
+
+def test_rows_survive_a_later_run_with_a_different_catalog(tmp_path):
+    save_manifest([result("Ring"), result("Necklace")], inputs_with(), tmp_path)
+    save_manifest([result("Bracelet")], inputs_with(), tmp_path)
+
+    reused, stale = plan_run(["Ring", "Bracelet"], load_latest_manifest(tmp_path), inputs_with())
+
+    assert sorted(reused) == ["Bracelet", "Ring"]
+    assert stale == []
+
+
+def test_failure_does_not_replace_a_good_row(tmp_path):
+    save_manifest([result("Ring")], inputs_with(), tmp_path)
+    save_manifest([result("Ring", title="Error: timeout", description="")], inputs_with(), tmp_path)
+
+    reused, _ = plan_run(["Ring"], load_latest_manifest(tmp_path), inputs_with())
+
+    assert reused["Ring"] == result("Ring")
+
+
+def test_corrupt_index_falls_back_to_run_files(tmp_path):
+    save_manifest([result("Ring")], inputs_with(), tmp_path)
+    save_manifest([result("Necklace")], inputs_with(), tmp_path)
+    (tmp_path / "index.json").write_text('{"rows": {"trunc')
+    # A run file with a row missing its product hash is skipped, not raised
+    (tmp_path / "run_99999999999999999999.json").write_text('{"rows": [{"Meta Title": "x"}]}')
+
+    reused, stale = plan_run(["Ring", "Necklace"], load_latest_manifest(tmp_path), inputs_with())
+
+    assert sorted(reused) == ["Necklace", "Ring"]
+    assert stale == []
+
+
+def test_old_run_files_are_pruned(tmp_path):
+    for i in range(5):
+        save_manifest([result(f"Ring {i}")], inputs_with(), tmp_path, keep_runs=3)
+
+    assert len(list(tmp_path.glob("run_*.json"))) == 3
+    reused, _ = plan_run(["Ring 0"], load_latest_manifest(tmp_path), inputs_with())
+    assert list(reused) == ["Ring 0"]
+
+
+def test_round_trip(tmp_path):
+    path = save_manifest([result("Ring")], inputs_with(), tmp_path)
+
+    assert os.path.exists(path)
+    row = load_latest_manifest(tmp_path)[row_inputs("Ring", KEYWORDS, TEMPLATE, MODEL)["product_hash"]]
+    assert row == {**row_inputs("Ring", KEYWORDS, TEMPLATE, MODEL), "Meta Title": "A Title",
+                   "Meta Description": "A description. Shop Now!"}
+
+
+def test_runs_saved_in_the_same_second_keep_their_order(tmp_path):
+    for i in range(3):
+        save_manifest([result("Ring", title=f"Title {i}")], inputs_with(), tmp_path)
+
+    names = sorted(path.name for path in tmp_path.glob("run_*.json"))
+    titles = [json.loads((tmp_path / name).read_text())["rows"][0]["Meta Title"] for name in names]
+    assert titles == ["Title 0", "Title 1", "Title 2"]
+
+
+def test_keep_runs_zero_prunes_every_run_file(tmp_path):
+    for i in range(3):
+        save_manifest([result(f"Ring {i}")], inputs_with(), tmp_path, keep_runs=0)
+
+    assert list(tmp_path.glob("run_*.json")) == []
+    assert len(load_latest_manifest(tmp_path)) == 3
@@ -0,0 +1,202 @@
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quota import FileClock, KeyClients, QuotaCoordinator, QuotaExhausted
+
+KEYS = ["key-a", "key-b"]
+REQUESTS_PER_WINDOW = 5
+WINDOW_SECONDS = 60
+
+
+def make_coordinator(tmp_dir):
+    clock = FileClock(os.path.join(tmp_dir, "clock"))
+    return QuotaCoordinator(
+        KEYS,
+        db_path=os.path.join(tmp_dir, "quota.sqlite3"),
+        requests_per_window=REQUESTS_PER_WINDOW,
+        window_seconds=WINDOW_SECONDS,
+        clock=clock,
+        sleep=clock.advance,
+    )
+
+
+def add_audit_log(tmp_dir):
+    # The ledger prunes old rows, so keep a copy of every lease to check windows afterwards
+    coordinator = make_coordinator(tmp_dir)
+    conn = sqlite3.connect(coordinator.db_path)
+    conn.executescript(
+        "CREATE TABLE audit (job_id TEXT, ts REAL);"
+        "CREATE TRIGGER audit_usage AFTER INSERT ON usage "
+        "BEGIN INSERT INTO audit VALUES (NEW.job_id, NEW.ts); END;"
+    )
+    conn.close()
+    return coordinator
+
+
+def read_audit(coordinator):
+    conn = sqlite3.connect(coordinator.db_path)
+    rows = conn.execute("SELECT job_id, ts FROM audit ORDER BY ts").fetchall()
+    conn.close()
+    return rows
+
+
+def busy_worker(tmp_dir, attempts):
+    coordinator = make_coordinator(tmp_dir)
+    job_id = coordinator.new_job()
+    for _ in range(attempts):
+        if coordinator.try_acquire(job_id) is None:
+            coordinator.sleep(1)
+
+
+def fair_worker(tmp_dir, barrier):
+    coordinator = make_coordinator(tmp_dir)
+    job_id = coordinator.new_job()
+    coordinator.try_acquire(job_id)
+    # Both jobs are registered before either starts draining the window
+    barrier.wait()
+    while coordinator.try_acquire(job_id) is not None:
+        pass
+
+
+def run_processes(target, args_list):
+    processes = [multiprocessing.Process(target=target, args=args) for args in args_list]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+
+def test_no_window_exceeds_total_capacity(tmp_path):
+    coordinator = add_audit_log(str(tmp_path))
+    run_processes(busy_worker, [(str(tmp_path), 150)] * 3)
+
+    timestamps = [ts for _, ts in read_audit(coordinator)]
+    assert timestamps
+    capacity = REQUESTS_PER_WINDOW * len(KEYS)
+    for end in timestamps:
+        in_window = [ts for ts in timestamps if end - WINDOW_SECONDS <= ts <= end]
+        assert len(in_window) <= capacity
+
+
+def test_two_active_jobs_split_capacity(tmp_path):
+    coordinator = add_audit_log(str(tmp_path))
+    barrier = multiprocessing.Barrier(2)
+    run_processes(fair_worker, [(str(tmp_path), barrier)] * 2)
+
+    per_job = {}
+    for job_id, _ in read_audit(coordinator):
+        per_job[job_id] = per_job.get(job_id, 0) + 1
+    half = REQUESTS_PER_WINDOW * len(KEYS) // 2
+    assert sorted(per_job.values()) == [half, half]
+
+
+def test_estimated_tokens_count_against_the_key_limit(tmp_path):
+    coordinator = make_coordinator(str(tmp_path))
+    coordinator.tokens_per_window = 1000
+    job_id = coordinator.new_job()
+
+    assert coordinator.try_acquire(job_id, est_tokens=1001) is None
+    assert coordinator.try_acquire(job_id, est_tokens=1000) is not None
+    assert coordinator.try_acquire(job_id, est_tokens=1000) is not None
+    # Both keys are now full on tokens even though they have requests left
+    assert coordinator.try_acquire(job_id, est_tokens=1) is None
+
+
+def test_record_replaces_the_estimate(tmp_path):
+    coordinator = make_coordinator(str(tmp_path))
+    coordinator.tokens_per_window = 1000
+    job_id = coordinator.new_job()
+    leases = [coordinator.try_acquire(job_id, est_tokens=1000) for _ in KEYS]
+    assert coordinator.try_acquire(job_id, est_tokens=500) is None
+
+    coordinator.record(leases[0][1], 400)
+
+    assert coordinator.try_acquire(job_id, est_tokens=500) is not None
+
+
+def test_jobs_split_the_token_budget(tmp_path):
+    coordinator = make_coordinator(str(tmp_path))
+    coordinator.tokens_per_window = 1000
+    big_job, small_job = coordinator.new_job(), coordinator.new_job()
+    coordinator.try_acquire(small_job, est_tokens=10)
+
+    # Two active jobs over 2 keys x 1000 tokens leaves 1000 tokens each
+    assert coordinator.try_acquire(big_job, est_tokens=900) is not None
+    assert coordinator.try_acquire(big_job, est_tokens=200) is None
+    assert coordinator.try_acquire(small_job, est_tokens=900) is not None
+
+
+def test_release_job_returns_its_share(tmp_path):
+    coordinator = make_coordinator(str(tmp_path))
+    job_a, job_b = coordinator.new_job(), coordinator.new_job()
+    coordinator.try_acquire(job_b)
+    while coordinator.try_acquire(job_a) is not None:
+        pass
+    assert coordinator.try_acquire(job_a) is None
+
+    coordinator.release_job(job_b)
+
+    assert coordinator.try_acquire(job_a) is not None
+
+
+def test_acquire_times_out(tmp_path):
+    coordinator = make_coordinator(str(tmp_path))
+    job_id = coordinator.new_job()
+    for _ in range(REQUESTS_PER_WINDOW * len(KEYS)):
+        coordinator.acquire(job_id, timeout=0)
+
+    start = coordinator.clock()
+    with pytest.raises(QuotaExhausted):
+        coordinator.acquire(job_id, timeout=10, poll_interval=1)
+    assert coordinator.clock() - start == 10
+
+
+def test_old_rows_leave_the_window(tmp_path):
+    coordinator = make_coordinator(str(tmp_path))
+    job_id = coordinator.new_job()
+    while coordinator.try_acquire(job_id) is not None:
+        pass
+
+    coordinator.clock.advance(WINDOW_SECONDS)
+    assert coordinator.try_acquire(job_id) is None
+    coordinator.clock.advance(1)
+    assert coordinator.try_acquire(job_id) is not None
+
+
+def test_requests_go_out_on_the_leased_key(tmp_path):
+    coordinator = make_coordinator(str(tmp_path))
+    coordinator.requests_per_window = 100
+    configured = {}
+
+    def factory(api_key):
+        # Mimics genai: configure() sets one process-wide key that the new client picks up
+        configured["key"] = api_key
+        time.sleep(0.01)
+        return {"key": configured["key"]}
+
+    clients = KeyClients(factory)
+    mismatches = []
+
+    def send(job_id):
+        for _ in range(20):
+            api_key, _ = coordinator.acquire(job_id, timeout=0)
+            if clients.get(api_key)["key"] != api_key:
+                mismatches.append(api_key)
+
+    job_id = coordinator.new_job()
+    threads = [threading.Thread(target=send, args=(job_id,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert mismatches == []